@@ -0,0 +1,74 @@
+# binops.py
+#
+# Handlers for the binary operators. They live outside interpreter.py so
+# the parser can use them without importing the whole runtime.
+
+from error_handler import LoxRuntimeError
+
+# Binary operators, the parser stamps each Binary node with its handler so
+# the interpreter doesn't have to pick one every time the node runs
+def _add(interpreter, left, right, node):
+    if type(left) is float is type(right):
+        return left + right
+    if type(left) is str is type(right):
+        return left + right
+    raise LoxRuntimeError(node.op, 'operands must be numbers')
+
+def _sub(interpreter, left, right, node):
+    if type(left) is float is type(right):
+        return left - right
+    raise LoxRuntimeError(node.op, 'operands must be numbers')
+
+def _mul(interpreter, left, right, node):
+    if type(left) is float is type(right):
+        return left * right
+    raise LoxRuntimeError(node.op, 'operands must be numbers')
+
+def _div(interpreter, left, right, node):
+    if type(left) is float is type(right):
+        try:
+            return left / right
+        except ZeroDivisionError as error:
+            print('ZeroDivisionError:', error)
+            return None
+    raise LoxRuntimeError(node.op, 'operands must be numbers')
+
+def _greater(interpreter, left, right, node):
+    if type(left) is float is type(right):
+        return left > right
+    raise LoxRuntimeError(node.op, 'operands must be numbers')
+
+def _greater_equal(interpreter, left, right, node):
+    if type(left) is float is type(right):
+        return left >= right
+    raise LoxRuntimeError(node.op, 'operands must be numbers')
+
+def _less(interpreter, left, right, node):
+    if type(left) is float is type(right):
+        return left < right
+    raise LoxRuntimeError(node.op, 'operands must be numbers')
+
+def _less_equal(interpreter, left, right, node):
+    if type(left) is float is type(right):
+        return left <= right
+    raise LoxRuntimeError(node.op, 'operands must be numbers')
+
+# Values of different types are never equal, even true and 1
+def _equal(interpreter, left, right, node):
+    return type(left) is type(right) and left == right
+
+def _not_equal(interpreter, left, right, node):
+    return not (type(left) is type(right) and left == right)
+
+BINARY_HANDLERS = {
+    '+': _add,
+    '-': _sub,
+    '*': _mul,
+    '/': _div,
+    '>': _greater,
+    '>=': _greater_equal,
+    '<': _less,
+    '<=': _less_equal,
+    '==': _equal,
+    '!=': _not_equal,
+}
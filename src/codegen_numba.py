@@ -0,0 +1,267 @@
+# codegen_numba.py
+#
+# Runs purely numeric bytecode as native code through Numba. Numba is an
+# optional dependency, when it isn't installed NUMBA_AVAILABLE is False and
+# the interpreter keeps everything on the VM. Importing it takes longer than
+# most scripts take to run, so that only happens once a loop qualifies.
+
+import importlib.util
+from expr import NodeVisitor
+from compiler import OpCode
+
+NUMBA_AVAILABLE = importlib.util.find_spec('numba') is not None
+
+# Instructions run natively between returns to Python, where a pending
+# KeyboardInterrupt gets raised
+STEP_BUDGET = 1 << 20
+
+# Set by _native_run on first use
+np = None
+_native = None
+
+# Plain ints, which Numba folds into the compiled loop as constants
+LOAD_CONST = int(OpCode.LOAD_CONST)
+LOAD_SLOT = int(OpCode.LOAD_SLOT)
+STORE_SLOT = int(OpCode.STORE_SLOT)
+DEFINE_SLOT = int(OpCode.DEFINE_SLOT)
+ADD = int(OpCode.ADD)
+SUB = int(OpCode.SUB)
+MUL = int(OpCode.MUL)
+DIV = int(OpCode.DIV)
+NEG = int(OpCode.NEG)
+NOT = int(OpCode.NOT)
+EQ = int(OpCode.EQ)
+LT = int(OpCode.LT)
+LE = int(OpCode.LE)
+GT = int(OpCode.GT)
+GE = int(OpCode.GE)
+POP = int(OpCode.POP)
+JUMP = int(OpCode.JUMP)
+JUMP_IF_FALSE = int(OpCode.JUMP_IF_FALSE)
+
+class NumericCheck(NodeVisitor):
+    '''
+    This class decides whether a statement can run natively: every value it
+    stores must be a number, and every condition a comparison, so the whole
+    statement fits in an array of floats with booleans as 1.0/0.0. Variables
+    have to hold a number before they are read, and nothing may be printed.
+
+    Attributes
+    ----------
+    defined : set
+        slots known to hold a number at this point of the statement
+    has_loop : bool
+        only statements with a loop are worth handing to Numba
+    '''
+    def __init__(self, defined):
+        super().__init__()
+        self.defined = defined
+        self.has_loop = False
+
+    def check(self, stmt):
+        return self.visit(stmt) is not None and self.has_loop
+
+    # Expressions return 'number', 'bool' or None when they can't run natively
+    def visit_Literal(self, node):
+        if isinstance(node.value, bool):
+            return 'bool'
+        if isinstance(node.value, float):
+            return 'number'
+        return None
+
+    def visit_Grouping(self, node):
+        return self.visit(node.value)
+
+    def visit_Logical(self, node):
+        return None
+
+    def visit_Unary(self, node):
+        right = self.visit(node.right)
+        if node.op.lexeme == '-':
+            return 'number' if right == 'number' else None
+        return 'bool' if right == 'bool' else None
+
+    def visit_Binary(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        if left is None or left != right:
+            return None
+
+        operator = node.op.lexeme
+        if operator in ('==', '!='):
+            return 'bool'
+        if left != 'number':
+            return None
+        if operator in ('+', '-', '*', '/'):
+            return 'number'
+        return 'bool'
+
+    def visit_Variable(self, node):
+        return 'number' if node.slot in self.defined else None
+
+    def visit_Assign(self, node):
+        if node.slot in self.defined and self.visit(node.value) == 'number':
+            return 'number'
+        return None
+
+    # Statements return True when they can run natively
+    def visit_ExprStmt(self, node):
+        return True if self.visit(node.value) else None
+
+    def visit_Print(self, node):
+        # Native code can't stream output or be interrupted, so a loop that
+        # prints (possibly forever) stays on the VM
+        return None
+
+    def visit_VarDeclaration(self, node):
+        if node.initializer is None or self.visit(node.initializer) != 'number':
+            return None
+        self.defined.add(node.slot)
+        return True
+
+    def visit_Block(self, node):
+        for stmt in node.statements:
+            if self.visit(stmt) is None:
+                return None
+        return True
+
+    def visit_IfStmt(self, node):
+        if self.visit(node.test) != 'bool' or self.visit(node.consequence) is None:
+            return None
+        if node.alternative and self.visit(node.alternative) is None:
+            return None
+        return True
+
+    def visit_WhileStmt(self, node):
+        self.has_loop = True
+        if self.visit(node.test) != 'bool' or self.visit(node.body) is None:
+            return None
+        return True
+
+def _run(code, operands, consts, locals_, stack, sp, ip, budget):
+    # The same loop as VM.run, on floats only. Stops after budget
+    # instructions and returns where it got to, so Python gets a chance to
+    # handle signals before it carries on.
+    n = code.shape[0]
+    while ip < n and budget > 0:
+        budget -= 1
+        op = code[ip]
+        arg = operands[ip]
+        ip += 1
+
+        if op == LOAD_SLOT:
+            stack[sp] = locals_[arg]
+            sp += 1
+        elif op == LOAD_CONST:
+            stack[sp] = consts[arg]
+            sp += 1
+        elif op == JUMP_IF_FALSE:
+            sp -= 1
+            if stack[sp] == 0.0:
+                ip = arg
+        elif op == JUMP:
+            ip = arg
+        elif op == STORE_SLOT:
+            locals_[arg] = stack[sp - 1]
+        elif op == POP:
+            sp -= 1
+        elif op == ADD:
+            sp -= 1
+            stack[sp - 1] = stack[sp - 1] + stack[sp]
+        elif op == SUB:
+            sp -= 1
+            stack[sp - 1] = stack[sp - 1] - stack[sp]
+        elif op == MUL:
+            sp -= 1
+            stack[sp - 1] = stack[sp - 1] * stack[sp]
+        elif op == DIV:
+            # Raises ZeroDivisionError, the caller then reruns on the VM
+            sp -= 1
+            stack[sp - 1] = stack[sp - 1] / stack[sp]
+        elif op == LT:
+            sp -= 1
+            stack[sp - 1] = 1.0 if stack[sp - 1] < stack[sp] else 0.0
+        elif op == LE:
+            sp -= 1
+            stack[sp - 1] = 1.0 if stack[sp - 1] <= stack[sp] else 0.0
+        elif op == GT:
+            sp -= 1
+            stack[sp - 1] = 1.0 if stack[sp - 1] > stack[sp] else 0.0
+        elif op == GE:
+            sp -= 1
+            stack[sp - 1] = 1.0 if stack[sp - 1] >= stack[sp] else 0.0
+        elif op == EQ:
+            sp -= 1
+            stack[sp - 1] = 1.0 if stack[sp - 1] == stack[sp] else 0.0
+        elif op == NOT:
+            stack[sp - 1] = 1.0 if stack[sp - 1] == 0.0 else 0.0
+        elif op == NEG:
+            stack[sp - 1] = -stack[sp - 1]
+        elif op == DEFINE_SLOT:
+            sp -= 1
+            locals_[arg] = stack[sp]
+
+    return sp, ip
+
+def _native_run():
+    # Compile _run on first use, it reads np as a global so that has to be
+    # bound before numba looks at it
+    global np, _native
+    if _native is None:
+        import numba
+        import numpy
+        np = numpy
+        _native = numba.njit(cache=True)(_run)
+    return _native
+
+def compile_native(code, operands, consts):
+    '''
+    Turn bytecode from the compiler into a native function. Calling it with
+    the values of the variable slots runs the code on a copy of them and
+    returns the updated slots.
+    '''
+    run_ = _native_run()
+    code = np.frombuffer(bytes(code), dtype=np.uint8)
+    operands = np.array(operands, dtype=np.int32)
+    # Anything that isn't a number is an operator token only used for errors
+    consts = np.array([float(value) if isinstance(value, (float, bool)) else 0.0
+                       for value in consts])
+
+    def run(values, budget=STEP_BUDGET):
+        locals_ = np.array([value if isinstance(value, float) else np.nan for value in values])
+        stack = np.empty(code.shape[0] + 1)
+        sp = ip = 0
+        while ip < code.shape[0]:
+            sp, ip = run_(code, operands, consts, locals_, stack, sp, ip, budget)
+        return locals_
+
+    return run
+
+def test_codegen():
+    from parse import Parser
+    from scanner import Scanner
+    from resolver import Resolver
+    from error_handler import ErrorHandler
+
+    def parse(source):
+        statements = Parser(Scanner(source, ErrorHandler()).scan_tokens(), ErrorHandler()).parse()
+        Resolver().resolve(statements)
+        return statements
+
+    def check(source):
+        defined = set()
+        return [NumericCheck(defined).check(stmt) for stmt in parse(source)]
+
+    assert check('var i = 0; while (i < 10) i = i + 1;') == [False, True]
+    # Test that a loop which prints stays on the VM, so its output streams
+    assert check('var i = 0; while (true) { print i; i = i + 1; }') == [False, False]
+    if NUMBA_AVAILABLE:
+        # Test that a loop resumes correctly across many small budgets
+        from compiler import Compiler
+        declaration, loop = parse('var i = 0; while (i < 1000) i = i + 1;')
+        run = compile_native(*Compiler().compile(loop))
+        assert run([0.0], budget=7)[0] == 1000
+    print('All tests passed!')
+
+if __name__ == '__main__':
+    test_codegen()
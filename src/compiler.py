@@ -0,0 +1,180 @@
+# compiler.py
+
+from array import array
+from enum import IntEnum, auto
+from expr import NodeVisitor
+
+class OpCode(IntEnum):
+    '''
+    Instructions understood by the VM, each fits in a byte. The operand of
+    an instruction is an index into the constants, a variable slot from the
+    resolver, or the target address for jumps.
+    '''
+    LOAD_CONST = auto()     # operand: value
+    LOAD_SLOT = auto()      # operand: variable slot
+    STORE_SLOT = auto()     # operand: variable slot, leaves the value on the stack
+    DEFINE_SLOT = auto()    # operand: variable slot, pops the value
+    ADD = auto()            # operand: operator token, for error reporting
+    SUB = auto()            # operand: operator token
+    MUL = auto()            # operand: operator token
+    DIV = auto()            # operand: operator token
+    NEG = auto()            # operand: operator token
+    NOT = auto()
+    EQ = auto()
+    LT = auto()             # operand: operator token
+    LE = auto()             # operand: operator token
+    GT = auto()             # operand: operator token
+    GE = auto()             # operand: operator token
+    PRINT = auto()
+    POP = auto()
+    JUMP = auto()           # operand: absolute target
+    JUMP_IF_FALSE = auto()  # operand: absolute target, pops the condition
+    DUP = auto()
+
+_BINARY_OPS = {
+    '+': OpCode.ADD,
+    '-': OpCode.SUB,
+    '*': OpCode.MUL,
+    '/': OpCode.DIV,
+    '<': OpCode.LT,
+    '<=': OpCode.LE,
+    '>': OpCode.GT,
+    '>=': OpCode.GE,
+}
+
+class Compiler(NodeVisitor):
+    '''
+    This class flattens a syntax tree into bytecode so it is walked once
+    instead of every time it is executed.
+
+    Attributes
+    ----------
+    code : bytearray
+        one opcode per instruction
+    operands : array
+        operand of each instruction, at the same index as its opcode
+    consts : list
+        values referenced by the operands in code
+    '''
+    def __init__(self):
+        super().__init__()
+        self.code = bytearray()
+        self.operands = array('i')
+        self.consts = []
+
+    def compile(self, node):
+        self.code = bytearray()
+        self.operands = array('i')
+        self.consts = []
+        self.visit(node)
+        return self.code, self.operands, self.consts
+
+    def emit(self, op, arg=0):
+        self.code.append(op)
+        self.operands.append(arg)
+
+    def make_const(self, value):
+        self.consts.append(value)
+        return len(self.consts) - 1
+
+    def emit_jump(self, op):
+        # Emit a jump with a placeholder target, returns where to patch it
+        self.emit(op, -1)
+        return len(self.code) - 1
+
+    def patch_jump(self, index):
+        self.operands[index] = len(self.code)
+
+    def visit_Literal(self, node):
+        self.emit(OpCode.LOAD_CONST, self.make_const(node.value))
+
+    def visit_Grouping(self, node):
+        self.visit(node.value)
+
+    def visit_Logical(self, node):
+        # Short-circuit on a copy of the left operand, which is also the
+        # result when the right one isn't evaluated
+        self.visit(node.left)
+        self.emit(OpCode.DUP)
+        if node.op.lexeme == 'or':
+            right_jump = self.emit_jump(OpCode.JUMP_IF_FALSE)
+            end_jump = self.emit_jump(OpCode.JUMP)
+            self.patch_jump(right_jump)
+        else:
+            end_jump = self.emit_jump(OpCode.JUMP_IF_FALSE)
+        self.emit(OpCode.POP)
+        self.visit(node.right)
+        self.patch_jump(end_jump)
+
+    def visit_Unary(self, node):
+        self.visit(node.right)
+
+        if node.op.lexeme == '-':
+            self.emit(OpCode.NEG, self.make_const(node.op))
+        elif node.op.lexeme == '!':
+            self.emit(OpCode.NOT)
+        else:
+            raise NotImplementedError(f'Bad operator {node.op}')
+
+    def visit_Binary(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+        operator = node.op.lexeme
+        if operator == '!=':
+            self.emit(OpCode.EQ)
+            self.emit(OpCode.NOT)
+        elif operator == '==':
+            self.emit(OpCode.EQ)
+        elif operator in _BINARY_OPS:
+            self.emit(_BINARY_OPS[operator], self.make_const(node.op))
+        else:
+            raise NotImplementedError(f'Bad operator {node.op}')
+
+    def visit_Variable(self, node):
+        self.emit(OpCode.LOAD_SLOT, node.slot)
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        self.emit(OpCode.STORE_SLOT, node.slot)
+
+    def visit_ExprStmt(self, node):
+        self.visit(node.value)
+        self.emit(OpCode.POP)
+
+    def visit_Print(self, node):
+        self.visit(node.value)
+        self.emit(OpCode.PRINT)
+
+    def visit_VarDeclaration(self, node):
+        if node.initializer:
+            self.visit(node.initializer)
+        else:
+            self.emit(OpCode.LOAD_CONST, self.make_const(None))
+        self.emit(OpCode.DEFINE_SLOT, node.slot)
+
+    def visit_Block(self, node):
+        # Scoping was settled by the resolver, a block is just its statements
+        for stmt in node.statements:
+            self.visit(stmt)
+
+    def visit_IfStmt(self, node):
+        self.visit(node.test)
+        else_jump = self.emit_jump(OpCode.JUMP_IF_FALSE)
+        self.visit(node.consequence)
+
+        if node.alternative:
+            end_jump = self.emit_jump(OpCode.JUMP)
+            self.patch_jump(else_jump)
+            self.visit(node.alternative)
+            self.patch_jump(end_jump)
+        else:
+            self.patch_jump(else_jump)
+
+    def visit_WhileStmt(self, node):
+        start = len(self.code)
+        self.visit(node.test)
+        exit_jump = self.emit_jump(OpCode.JUMP_IF_FALSE)
+        self.visit(node.body)
+        self.emit(OpCode.JUMP, start)
+        self.patch_jump(exit_jump)
@@ -1,11 +1,28 @@
 # error_handler.py
 
-from tokens import Token
 from token_type import TokenType
 
-class ErrorHandler(Exception):
+class LoxRuntimeError(RuntimeError):
     '''
-    This class helps tell the user some syntax error occured and report it
+    This class is raised when a running script hits an error, e.g. applying
+    an arithmetic operator to something that is not a number
+
+    Attributes
+    ----------
+    token : Token
+        operator that failed, used to report the line
+    message : str
+        description of the error
+    '''
+    def __init__(self, token, message):
+        super().__init__(message)
+        self.token = token
+        self.message = message
+
+class ErrorHandler:
+    '''
+    This class helps tell the user some syntax error occured and report it.
+    The scanner reports errors by line and the parser by token.
 
     Attributes
     ----------
@@ -15,18 +32,19 @@ class ErrorHandler(Exception):
         to catch errors when a script is running
         
     '''
+    __slots__ = ['had_error', 'had_runtime_error']
     def __init__(self):
         self.had_error = False
         self.had_runtime_error = False
 
-    def error(self, token, message):
-        if isinstance(token, Token):
-            if token.type == TokenType.EOF:
-                self.report(token.line, "", message)
-            else: 
-                self.report(token.line,  " at '" + token.lexeme + "'", message)
-        else:
-            self.report(token, '', message)
+    def error_at_token(self, token, message):
+        if token.type == TokenType.EOF:
+            self.report(token.line, "", message)
+        else: 
+            self.report(token.line,  " at '" + token.lexeme + "'", message)
+
+    def error_at_line(self, line, message):
+        self.report(line, '', message)
 
     def runtime_error(self, error):
         print(f'{error.message}\n[line {error.token.line}]')
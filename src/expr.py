@@ -3,30 +3,50 @@
 from tokens import Token
 from token_type import TokenType
 
-class Node:
+class NodeMeta(type):
+    '''
+    This metaclass gives every node class __slots__ matching its fields and
+    attributes, so nodes don't carry a __dict__. Slots have to be known when
+    the class is created, by __init_subclass__ it's already too late.
+    '''
+    def __new__(meta, name, bases, namespace):
+        namespace.setdefault('__slots__', tuple(namespace.get('_fields', ())) +
+                                          tuple(namespace.get('_attributes', ())))
+        return super().__new__(meta, name, bases, namespace)
+
+class Node(metaclass=NodeMeta):
     '''
     This is a base class to construct non-terminal nodes. Each instance 
     represents a single AST node.
     '''
      # Track define AST node-names for some later sanity checks
     _nodenames = set()
+    # Map node-names to their classes so visitors can resolve them
+    _registry = {}
     @classmethod
     def __init_subclass__(cls):
         Node._nodenames.add(cls.__name__)
+        Node._registry[cls.__name__] = cls
+
+        # Generate straight-line methods over the known fields instead of
+        # looping over them for every node
+        fields = cls._fields
+        args = ''.join(f', {name}' for name in fields)
+        assigns = ''.join(f'    self.{name} = {name}\n' for name in fields) or '    pass\n'
+        reprs = ', '.join(f'{name}={{self.{name}!r}}' for name in fields)
+        compares = ''.join(f' and self.{name} == other.{name}' for name in fields)
+        source = (f'def __init__(self{args}):\n{assigns}'
+                  f'def __repr__(self):\n    return f"{cls.__name__}({reprs})"\n'
+                  f'def __eq__(self, other):\n    return type(self) is type(other){compares}\n')
+        namespace = {}
+        exec(source, namespace)
+        cls.__init__ = namespace['__init__']
+        cls.__repr__ = namespace['__repr__']
+        cls.__eq__ = namespace['__eq__']
 
     _fields = []
-    def __init__(self, *args):
-        assert len(args) == len(type(self)._fields)
-        # Match the instance field names to it's corresponging arguments
-        for name, val in zip(type(self)._fields, args):
-            setattr(self, name, val)
-
-    def __repr__(self):
-        args = ', '.join(f'{key}={value!r}' for key, value in vars(self).items())
-        return f'{type(self).__name__}({args})'
-
-    def __eq__(self, other):
-        return type(self) == type(other) and vars(self) == vars(other)
+    # Extra data filled in by later passes, not part of the node's structure
+    _attributes = []
 
 # -- Expressions represent values
 class Expr(Node):
@@ -34,6 +54,7 @@ class Expr(Node):
 
 class Binary(Expr):
     _fields = ['left', 'op', 'right']
+    _attributes = ['handler']
 
 class Grouping(Expr):
     _fields = ['value']
@@ -46,12 +67,19 @@ class Logical(Expr):
 
 class Unary(Expr):
     _fields = ['op', 'right']
+    # NEGATE or NOT, so the interpreter doesn't compare lexemes
+    _attributes = ['op_kind']
+
+NEGATE = 0
+NOT = 1
 
 class Variable(Expr):
     _fields = ['name']
+    _attributes = ['slot']
 
 class Assign(Expr):
     _fields = ['name', 'value']
+    _attributes = ['slot']
 
 # -- Statements represent actions with no associated value
 class Statement(Node):
@@ -66,6 +94,11 @@ class ExprStmt(Statement):
 class Block(Statement):
     _fields = ['statements']
 
+    @property
+    def introduces_scope(self):
+        # Only a block that declares something needs a scope of its own
+        return any(isinstance(stmt, VarDeclaration) for stmt in self.statements)
+
 class IfStmt(Statement):
     _fields = ['test', 'consequence', 'alternative']
 
@@ -81,6 +114,7 @@ class Declaration(Statement):
 
 class VarDeclaration(Declaration):
     _fields = ['name', 'initializer']
+    _attributes = ['slot']
 
 class NodeVisitor:
     '''
@@ -93,9 +127,17 @@ class NodeVisitor:
         visitors = { key for key in cls.__dict__ if key.startswith('visit_') }
         assert all(key[6:] in Node._nodenames for key in visitors)
 
+        # Resolve the node type of every visit method once, including the
+        # ones inherited from other visitors
+        cls._visit_table = { Node._registry[key[6:]]: getattr(cls, key)
+                             for key in dir(cls) if key.startswith('visit_') }
+
+    def __init__(self):
+        self._dispatch = { node_type: method.__get__(self)
+                           for node_type, method in type(self)._visit_table.items() }
+
     def visit(self, node):
-        method = f'visit_{type(node).__name__}'
-        return getattr(self, method)(node)
+        return self._dispatch[type(node)](node)
     
 class ASTPrinter(NodeVisitor):
     def print_ast(self, node):
@@ -1,44 +1,68 @@
 # interpreter.py
 
-from expr import NodeVisitor
-from error_handler import ErrorHandler
-from collections import ChainMap
+from expr import NodeVisitor, NEGATE
+from error_handler import ErrorHandler, LoxRuntimeError
+from compiler import Compiler
+from resolver import Resolver
+from vm import VM
+import codegen_numba
+import functools
+
+@functools.lru_cache(maxsize=1024)
+def _stringify_float(value):
+    # Loops tend to print the same numbers over and over, format each once.
+    # 0.0 and -0.0 hash alike, so stringify keeps zero out of the cache.
+    text = str(value)
+    if text.endswith('.0'):
+        text = text[0:len(text) - 2]
+    return text
 
 class Interpreter(NodeVisitor):
     '''
-    This class traverses through a syntax tree 
+    This class compiles each statement to bytecode and runs it on the VM,
+    traversing through the syntax tree for anything the compiler can't handle
     '''
     def __init__(self):
+        super().__init__()
         self.error_handler = ErrorHandler()
-        self.env = ChainMap()
+        self.resolver = Resolver()
+        self.locals = []
+        self.compiler = Compiler()
+        self.vm = VM(self)
         
     def interpret(self, node):
+        # Grow the variable slots to fit whatever the new code declares
+        slots = self.resolver.resolve(node)
+        self.locals.extend([None] * (slots - len(self.locals)))
+
         try: 
             for stmt in node:
-                self.visit(stmt)
+                try:
+                    code, operands, consts = self.compiler.compile(stmt)
+                except NotImplementedError:
+                    self.visit(stmt)
+                else:
+                    if not (codegen_numba.NUMBA_AVAILABLE and self.run_native(stmt, code, operands, consts)):
+                        self.vm.run(code, operands, consts)
         except RuntimeError as error:
             self.error_handler.runtime_error(error)
 
-    def check_numeric_operands(self, node, left, right):
-        if isinstance(left, float) and isinstance(right, float):
-            return True
-        else: 
-            self.error_handler.error(node, 'operands must be numbers')
-    
-    def check_numeric_operand(self, node, value):
-        if isinstance(value, float):
-            return True
-        else:
-            self.error_handler.error(node, 'operand must be a number')
+    def run_native(self, stmt, code, operands, consts):
+        # Numeric loops run through Numba, returns False to use the VM instead
+        defined = { slot for slot, value in enumerate(self.locals) if isinstance(value, float) }
+        check = codegen_numba.NumericCheck(defined)
+        if not check.check(stmt):
+            return False
 
-    def execute_Block(self, node, env):
-        previous = self.env
         try:
-            self.env = env
-            for stmt in node: 
-                self.visit(stmt)
-        finally:
-            self.env = previous
+            values = codegen_numba.compile_native(code, operands, consts)(self.locals)
+        except ZeroDivisionError:
+            # Nothing was stored yet, the VM reports it as usual
+            return False
+
+        for slot in check.defined:
+            self.locals[slot] = float(values[slot])
+        return True
 
     def visit_Literal(self, node):
         return node.value
@@ -57,16 +81,14 @@ class Interpreter(NodeVisitor):
     def visit_Unary(self, node):
         right = self.visit(node.right)
 
-        if node.op.lexeme == '-':
-            self.check_numeric_operand(node, right)
+        if node.op_kind == NEGATE:
+            if type(right) is not float:
+                raise LoxRuntimeError(node.op, 'operand must be a number')
             return -right
-        elif node.op.lexeme == '!':
-            return not self.is_truthy(right)
-        else: 
-            raise NotImplementedError(f'Bad operator {node.op}')
+        return right is None or right is False
         
     def visit_Variable(self, node):
-        return self.env.get(node.name.lexeme)
+        return self.locals[node.slot]
     
     def visit_WhileStmt(self, node):
         while self.is_truthy(self.visit(node.test)):
@@ -75,40 +97,7 @@ class Interpreter(NodeVisitor):
     def visit_Binary(self, node):
         left = self.visit(node.left)
         right = self.visit(node.right)
-
-        operator = node.op.lexeme
-        match operator:
-            case '-':
-                self.check_numeric_operands(node, left, right)
-                return left - right
-            case '/':
-                try:
-                    self.check_numeric_operands(node, left, right)
-                    return left / right
-                except ZeroDivisionError as error:
-                    print('ZeroDivisionError:', error)
-            case '*':
-                self.check_numeric_operands(node, left, right)
-                return left * right
-            case '+':
-                (isinstance(left, str) and isinstance(right, str)) or self.check_numeric_operands(node, left, right)
-                return left + right 
-            case '>':
-                self.check_numeric_operands(node, left, right)
-                return left > right
-            case '>=':
-                self.check_numeric_operands(node, left, right)
-                return left >= right
-            case '<':
-                self.check_numeric_operands(node, left, right)
-                return left < right
-            case '<=':
-                self.check_numeric_operands(node, left, right)
-                return left <= right
-            case '!=':
-                return not self.is_equal(left, right)
-            case '==':
-                return self.is_equal(left, right)
+        return node.handler(self, left, right, node)
             
      # TODO: Check if return in valid       
     def visit_ExprStmt(self, node):
@@ -130,47 +119,43 @@ class Interpreter(NodeVisitor):
         else:
             initializer = None
 
-        self.env[node.name.lexeme] = initializer
+        self.locals[node.slot] = initializer
 
     # IMPORTANT: Check for runtime errors
     def visit_Assign(self, node):
         value = self.visit(node.value)
-        self.env[node.name.lexeme] = value
+        self.locals[node.slot] = value
         return value 
     
     def visit_Block(self, node):
-        self.execute_Block(node.statements, self.env.new_child())
+        for stmt in node.statements:
+            self.visit(stmt)
  
     def is_truthy(self, value):
         # Logic to decide what happens when you use something other than true or false
-        if value is None:
-            return False
-        elif isinstance(value, bool):
-            return value
-        else:
-            return True
+        return value is not None and value is not False
         
     def is_equal(self, a, b):
-        if a is None and b is None:
-            return True
-        elif a is None:
-            return False
-        return a.__eq__(b)
+        # nil is only equal to nil, and true isn't equal to 1
+        return type(a) is type(b) and a == b
     
     def stringify(self, value):
         # Converts the expression result value to a string 
         if value is None:
             return 'nil'
-        elif isinstance(value, float):
-            text = str(value)
-            if text.endswith('.0'):
-                text = text[0:len(text) - 2]
-            return text
+        elif type(value) is str:
+            return value
+        elif type(value) is float:
+            if value == 0:
+                return '-0' if str(value)[0] == '-' else '0'
+            return _stringify_float(value)
         return str(value)
     
 def test_interpreter():
     from parse import Parser
     from scanner import Scanner
+    import contextlib
+    import io
     
     def interpret(source):
         interpreter = Interpreter()
@@ -179,6 +164,12 @@ def test_interpreter():
         expression = parser.parse()
         return interpreter.interpret(expression)
 
+    def output(source):
+        buffer = io.StringIO()
+        with contextlib.redirect_stdout(buffer):
+            interpret(source)
+        return buffer.getvalue()
+
     #assert interpret('-2+3;') == '1'
     #assert interpret('2+3*4;') == '14'
     #assert interpret('2*3+4;') == '10'
@@ -217,6 +208,17 @@ def test_interpreter():
               'temp = a;\n'
               'a = b;\n'
               '}')
+    # Test that values of different types are never equal
+    assert output('print true == 1;') == 'False\n'
+    assert output('print 0 == false;') == 'False\n'
+    assert output('print nil != false;') == 'True\n'
+    assert output('print 1 == 1;') == 'True\n'
+    # Test that and/or short-circuit and produce one of their operands
+    assert output('print nil or "yes";') == 'yes\n'
+    assert output('print 1 or x;') == '1\n'
+    assert output('print false and x;') == 'False\n'
+    assert output('print 1 and 2;') == '2\n'
+    assert output('var i = 0; while (i < 3 and true) { print i; i = i + 1; }') == '0\n1\n2\n'
     #interpret("var b = 2;")
     #interpret("print a + b;")
     #print('Good tests!')
@@ -2,31 +2,116 @@
 
 from token_type import TokenType
 from expr import *
+from binops import BINARY_HANDLERS
+import math
+
+# The token types the parsing methods use, as module globals. Reading
+# TokenType.X is an attribute lookup on the enum class, several times
+# slower than a global.
+LEFT_PAREN = TokenType.LEFT_PAREN
+RIGHT_PAREN = TokenType.RIGHT_PAREN
+RIGHT_BRACE = TokenType.RIGHT_BRACE
+MINUS = TokenType.MINUS
+SEMICOLON = TokenType.SEMICOLON
+SLASH = TokenType.SLASH
+BANG = TokenType.BANG
+EQUAL = TokenType.EQUAL
+IDENTIFIER = TokenType.IDENTIFIER
+STRING = TokenType.STRING
+NUMBER = TokenType.NUMBER
+ELSE = TokenType.ELSE
+VAR = TokenType.VAR
+EOF = TokenType.EOF
 
 class ParseError(Exception):
     pass
 
+# Operators that can be evaluated at parse time when both operands are
+# literal numbers, matching what the interpreter would compute
+_NUMERIC_FOLDS = {
+    TokenType.PLUS: lambda a, b: a + b,
+    TokenType.MINUS: lambda a, b: a - b,
+    TokenType.STAR: lambda a, b: a * b,
+    TokenType.SLASH: lambda a, b: a / b,
+    TokenType.GREATER: lambda a, b: a > b,
+    TokenType.GREATER_EQUAL: lambda a, b: a >= b,
+    TokenType.LESS: lambda a, b: a < b,
+    TokenType.LESS_EQUAL: lambda a, b: a <= b,
+    TokenType.EQUAL_EQUAL: lambda a, b: a == b,
+    TokenType.BANG_EQUAL: lambda a, b: a != b,
+}
+
+# The subset that also applies to two literal strings
+_STRING_FOLDS = {
+    TokenType.PLUS: lambda a, b: a + b,
+    TokenType.EQUAL_EQUAL: lambda a, b: a == b,
+    TokenType.BANG_EQUAL: lambda a, b: a != b,
+}
+
+# Binding power of the infix operators, higher binds tighter
+_PRECEDENCE = {
+    TokenType.OR: 1,
+    TokenType.AND: 2,
+    TokenType.BANG_EQUAL: 3,
+    TokenType.EQUAL_EQUAL: 3,
+    TokenType.GREATER: 4,
+    TokenType.GREATER_EQUAL: 4,
+    TokenType.LESS: 4,
+    TokenType.LESS_EQUAL: 4,
+    TokenType.MINUS: 5,
+    TokenType.PLUS: 5,
+    TokenType.SLASH: 6,
+    TokenType.STAR: 6,
+}
+
+# The ones at or below this short-circuit and build Logical nodes
+_LOGICAL_PRECEDENCE = 2
+
+# Keywords error recovery stops in front of
+_STATEMENT_STARTS = frozenset({
+    TokenType.CLASS, TokenType.FUN, TokenType.VAR, TokenType.FOR,
+    TokenType.IF, TokenType.WHILE, TokenType.PRINT, TokenType.RETURN,
+})
+
+_UNARY_OPERATORS = frozenset({TokenType.BANG, TokenType.MINUS})
+
+# Keywords that are a whole primary expression on their own
+_PRIMARY_LITERALS = {
+    TokenType.FALSE: False,
+    TokenType.TRUE: True,
+    TokenType.NIL: None,
+}
+
 class Parser: 
-    _tokens = []
+    _tokens = None
+    _types = []
     _current = 0
+    # Types of the current and previous tokens, kept in step with _current
+    # so checking the lookahead needs no indexing
+    _cur_type = EOF
+    _prev_type = None
 
     def __init__(self, tokens, error_handler):
         self.error_handler = error_handler
         self._tokens = tokens
+        self._types = tokens.types
+        self._cur_type = tokens.types[0]
+        # One shared Literal node per distinct value
+        self._literals = {}
 
     def parse(self):
         statements = list()
         while not self.is_at_end():
             statements.append(self.declaration())
 
-        return statements
+        return self.flatten(statements)
 
     def expression(self):
         return self.assignment()
 
     def declaration(self):
         try:
-            if self.match(TokenType.VAR):
+            if self._match1(VAR):
                 return self.var_declaration()
             else: 
                 return self.statement()
@@ -35,264 +120,295 @@ class Parser:
             return None
         
     def statement(self):
-        if self.match(TokenType.FOR):
-            return self.for_statement()
-        if self.match(TokenType.IF):
-            return self.if_statement()
-        if self.match(TokenType.PRINT):
-            return self.print_statement()
-        if self.match(TokenType.WHILE):
-            return self.while_statement()
-        if self.match(TokenType.LEFT_BRACE):
-            return Block(self.block())
-        return self.expression_statement()
+        # One lookup on the keyword instead of trying each one in turn
+        parse_statement = _STATEMENTS[self._cur_type]
+        if parse_statement is None:
+            return self.expression_statement()
+        self.advance()
+        return parse_statement(self)
+
+    def block_statement(self):
+        return Block(self.flatten(self.block()))
     
     def for_statement(self):
-        self.consume(TokenType.LEFT_PAREN,  "Expect '(' after 'for'.")
+        self.consume(LEFT_PAREN,  "Expect '(' after 'for'.")
 
-        if self.match(TokenType.SEMICOLON):
+        if self._match1(SEMICOLON):
             initializer = None
-        elif self.match(TokenType.VAR):
+        elif self._match1(VAR):
             initializer = self.var_declaration()
         else: 
             initializer = self.expression_statement()
 
         condition = None
-        if not self.check(TokenType.SEMICOLON):
+        if not self.check(SEMICOLON):
             condition = self.expression()
-        self.consume(TokenType.SEMICOLON,  "Expect ';' after loop condition.")
+        self.consume(SEMICOLON,  "Expect ';' after loop condition.")
 
         increment = None
-        if not self.check(TokenType.RIGHT_PAREN):
+        if not self.check(RIGHT_PAREN):
             increment = self.expression()
-        self.consume(TokenType.RIGHT_PAREN,  "Expect ')' after for clauses.")
+        self.consume(RIGHT_PAREN,  "Expect ')' after for clauses.")
 
         body = self.statement()
 
         if increment is not None:
-            body = Block([body, ExprStmt(increment)])
+            body = Block(self.flatten([body, ExprStmt(increment)]))
         
         if condition is None:
-            condition = Literal(True)
+            condition = self.literal(True)
         body = WhileStmt(condition, body)
 
         if initializer is not None: 
-            body = Block([initializer, body])
+            body = Block(self.flatten([initializer, body]))
 
         return body
     
     def if_statement(self):
-        self.consume(TokenType.LEFT_PAREN,  "Expect '(' after 'if'.")
+        self.consume(LEFT_PAREN,  "Expect '(' after 'if'.")
         test = self.expression()
-        self.consume(TokenType.RIGHT_PAREN, "Expect ')' after if condition.")
+        self.consume(RIGHT_PAREN, "Expect ')' after if condition.")
 
         consequence = self.statement()
         alternative = None
-        if self.match(TokenType.ELSE):
+        if self._match1(ELSE):
             alternative = self.statement()
         return IfStmt(test, consequence, alternative)
     
     def print_statement(self):
         value = self.expression()
-        self.consume(TokenType.SEMICOLON, "Expect ';' after value.")
+        self.consume(SEMICOLON, "Expect ';' after value.")
         return Print(value)
     
     def var_declaration(self):
-        name = self.consume(TokenType.IDENTIFIER, "Expect variable name.")
+        self.consume(IDENTIFIER, "Expect variable name.")
+        name = self.previous()
 
         identifier = None
-        if self.match(TokenType.EQUAL):
+        if self._match1(EQUAL):
             identifier = self.expression()
 
-        self.consume(TokenType.SEMICOLON, "Expect ';' after variable declaration")
+        self.consume(SEMICOLON, "Expect ';' after variable declaration")
         return VarDeclaration(name, identifier)
     
     def while_statement(self):
-        self.consume(TokenType.LEFT_PAREN,  "Expect '(' after 'while'.")
+        self.consume(LEFT_PAREN,  "Expect '(' after 'while'.")
         test = self.expression()
-        self.consume(TokenType.RIGHT_PAREN, "Expect ')' after condition.")
+        self.consume(RIGHT_PAREN, "Expect ')' after condition.")
         body = self.statement()
         return WhileStmt(test, body)
     
     def expression_statement(self):
         value = self.expression()
-        self.consume(TokenType.SEMICOLON, "Expect ';' after expression.")
+        self.consume(SEMICOLON, "Expect ';' after expression.")
         return ExprStmt(value)
     
     def block(self):
         statements = []
 
-        while not self.check(TokenType.RIGHT_BRACE) and not self.is_at_end():
+        while not self.check(RIGHT_BRACE) and not self.is_at_end():
             statements.append(self.declaration())
 
-        self.consume(TokenType.RIGHT_BRACE, "Expect '}' after block.")
+        self.consume(RIGHT_BRACE, "Expect '}' after block.")
         return statements
     
+    def flatten(self, statements):
+        # Splice in nested blocks that don't declare anything, fewer levels
+        # for the interpreter to walk through. Inner blocks were already
+        # flattened when they were parsed.
+        flat = []
+        for stmt in statements:
+            if isinstance(stmt, Block) and not stmt.introduces_scope:
+                flat.extend(stmt.statements)
+            else:
+                flat.append(stmt)
+        return flat
+    
     def assignment(self):
-        expr = self._or()
+        expr = self.infix_expression()
 
-        if self.match(TokenType.EQUAL):
-            equals = self.previous()
+        if self._match1(EQUAL):
+            # Only the position, the '=' token is built if there's an error
+            equals = self._current - 1
             value = self.assignment()
 
             if isinstance(expr, Variable):
                 name = expr.name
                 return Assign(name, value)
             
-            self.error(equals, "Invalid assignment target.")
-
-        return expr
-    
-    def _or(self):
-        expr = self._and()
-    
-        while self.match(TokenType.OR):
-            operator = self.previous()
-            right = self._and()
-            expr = Logical(expr, operator, right)
-        
-        return expr
-    
-    def _and(self):
-        expr = self.equality()
-
-        while self.match(TokenType.AND):
-            operator = self.previous()
-            right = self.equality()
-            expr = Logical(expr, operator, right)
-
-        return expr
-
-    def equality(self):
-        expr = self.comparison()
-        
-        while self.match(TokenType.BANG_EQUAL, TokenType.EQUAL_EQUAL):
-            operator = self.previous()
-            right = self.comparison()
-            expr = Binary(expr, operator, right)
-        
-        return expr
-    
-    def comparison(self):
-        expr = self.term()
-
-        while self.match(TokenType.GREATER, TokenType.GREATER_EQUAL, TokenType.LESS, TokenType.LESS_EQUAL):
-            operator = self.previous()
-            right = self.term()
-            expr = Binary(expr, operator, right)
-
-        return expr
-    
-    def term(self):
-        expr = self.factor()
-
-        while self.match(TokenType.MINUS, TokenType.PLUS):
-            operator = self.previous()
-            right = self.factor()
-            expr = Binary(expr, operator, right)
+            self.error(self._tokens.token(equals), "Invalid assignment target.")
 
         return expr
     
-    def factor(self):
+    def infix_expression(self, min_precedence=1):
+        # Precedence climbing over _PRECEDENCE, one call per operator instead
+        # of going through every precedence level for each operand
         expr = self.unary()
-
-        while self.match(TokenType.SLASH, TokenType.STAR):
-            operator = self.previous()
-            right = self.unary()
-            expr = Binary(expr, operator, right)
-
-        return expr
+        # Bound once, the loop runs for every operator in the expression
+        types = self._types
+        precedence_of = _PRECEDENCE.get
+
+        while True:
+            type = self._cur_type
+            precedence = precedence_of(type)
+            if precedence is None or precedence < min_precedence:
+                return expr
+            current = self._current
+            self._prev_type = type
+            self._current = current + 1
+            self._cur_type = types[current + 1]
+            operator = self._tokens.token(current)
+            # All of them are left associative, so the right operand only
+            # takes operators that bind tighter
+            right = self.infix_expression(precedence + 1)
+            if precedence <= _LOGICAL_PRECEDENCE:
+                expr = Logical(expr, operator, right)
+            else:
+                expr = self.binary(expr, operator, right)
     
     def unary(self):
-        if self.match(TokenType.BANG, TokenType.MINUS):
+        if self._cur_type in _UNARY_OPERATORS:
+            self.advance()
             operator = self.previous()
             right = self.unary()
-            return Unary(operator, right)
+            expr = self.fold(Unary(operator, right))
+            if isinstance(expr, Unary):
+                expr.op_kind = NEGATE if operator.type == MINUS else NOT
+            return expr
 
         return self.primary()
     
     def primary(self):
-        if self.match(TokenType.FALSE):
-            return Literal(False)
-        elif self.match(TokenType.TRUE):
-            return Literal(True)
-        elif self.match(TokenType.NIL):
-            return Literal(None)
-        elif self.match(TokenType.NUMBER, TokenType.STRING):
-            return Literal(self.previous().literal)
-        elif self.match(TokenType.IDENTIFIER):
-            return Variable(self.previous()) 
+        type = self._cur_type
+        if type == IDENTIFIER:
+            self.advance()
+            return Variable(self.previous())
+        elif type == NUMBER or type == STRING:
+            self.advance()
+            return self.literal(self._tokens.literals[self._current - 1])
+        elif type in _PRIMARY_LITERALS:
+            self.advance()
+            return self.literal(_PRIMARY_LITERALS[type])
         
-        if self.match(TokenType.LEFT_PAREN):
+        if self._match1(LEFT_PAREN):
             expr = self.expression()
-            self.consume(TokenType.RIGHT_PAREN, "Expect ')' after expression.")
+            self.consume(RIGHT_PAREN, "Expect ')' after expression.")
+            # A folded constant needs no grouping, keep it foldable further up
+            if isinstance(expr, Literal):
+                return expr
             return Grouping(expr)
         
-        self.error(self.peek(), 'Expect expression.')
+        raise self.error(self.peek(), 'Expect expression.')
+
+    def literal(self, value):
+        # Keyed by type too, 1.0 and true are equal as dict keys, and by sign
+        # for floats since 0.0 and -0.0 are too
+        if type(value) is float:
+            key = (float, value, math.copysign(1.0, value))
+        else:
+            key = (type(value), value)
+        node = self._literals.get(key)
+        if node is None:
+            node = self._literals[key] = Literal(value)
+        return node
+
+    def binary(self, left, operator, right):
+        expr = self.fold(Binary(left, operator, right))
+        if isinstance(expr, Binary):
+            expr.handler = BINARY_HANDLERS[operator.lexeme]
+        return expr
+
+    def fold(self, expr):
+        # Evaluate operators applied to literals once here, instead of every 
+        # time the interpreter runs over them (e.g. inside a loop)
+        if isinstance(expr, Unary):
+            if not isinstance(expr.right, Literal):
+                return expr
+            value = expr.right.value
+            if expr.op.type == BANG:
+                return self.literal(value is None or value is False)
+            if isinstance(value, float):
+                return self.literal(-value)
+            return expr
+
+        if not (isinstance(expr.left, Literal) and isinstance(expr.right, Literal)):
+            return expr
+        left, right = expr.left.value, expr.right.value
+
+        if isinstance(left, float) and isinstance(right, float):
+            # Leave division by zero for the interpreter to report
+            if expr.op.type == SLASH and right == 0:
+                return expr
+            return self.literal(_NUMERIC_FOLDS[expr.op.type](left, right))
+        if isinstance(left, str) and isinstance(right, str) and expr.op.type in _STRING_FOLDS:
+            return self.literal(_STRING_FOLDS[expr.op.type](left, right))
+        return expr
     
-    def match(self, *types):
-        for type in types: 
-            if self.check(type):
-                self.advance()
-                return True
-        
+    # Steps past the current token when it has the given type
+    def _match1(self, type):
+        # Token types are enum singletons, identity is the cheapest compare
+        if self._cur_type is type:
+            current = self._current + 1
+            self._prev_type = type
+            self._current = current
+            self._cur_type = self._types[current]
+            return True
+
         return False
-    
+
     def consume(self, type, message):
         if self.check(type):
-            return self.advance()
+            self.advance()
         else: 
-            self.error(self.peek(), message)
+            raise self.error(self.peek(), message)
     
     def check(self, type):
-        if self.is_at_end():
-            return False
-        return self.peek().type == type
+        return self._cur_type is type
         
     def advance(self):
-        if not self.is_at_end():
-            self._current += 1
-        return self.previous()
+        # Only called on a token that was already checked, which is never
+        # EOF, so there's always a next token to move to
+        current = self._current + 1
+        self._prev_type = self._cur_type
+        self._current = current
+        self._cur_type = self._types[current]
     
     def is_at_end(self):
-        return self.peek().type == TokenType.EOF
+        return self._cur_type is EOF
 
     def peek(self):
-        return self._tokens[self._current]
+        return self._tokens.token(self._current)
 
     def previous(self):
-        return self._tokens[self._current - 1]
+        return self._tokens.token(self._current - 1)
     
     def error(self, token, message):
-        self.error_handler.error(token, message)
+        self.error_handler.error_at_token(token, message)
         return ParseError()
     
     def synchronize(self):
+        # Skip to what is probably the start of the next statement, so one
+        # mistake doesn't cascade into a stream of errors
+        if self.is_at_end():
+            return
         self.advance()
 
         while not self.is_at_end():
-            if self.previous().type == TokenType.SEMICOLON:
-                return
-            
-        match self.peek().type:
-            case 'CLASS':
-                return
-            case 'FUN':
-                return
-            case 'VAR':
+            if self._prev_type is SEMICOLON:
                 return
-            case 'FOR':
+            if self._cur_type in _STATEMENT_STARTS:
                 return
-            case 'IF':
-                return
-            case 'WHILE':
-                return
-            case 'PRINT':
-                return
-            case 'RETURN':
-                return
-        
-        self.advance()
+            self.advance()
+
+# Statements that start with a keyword (or a brace), indexed by that
+# token's type, None for anything else. Down here so it can refer to the
+# Parser methods.
+_STATEMENTS = [None] * (max(TokenType) + 1)
+_STATEMENTS[TokenType.FOR] = Parser.for_statement
+_STATEMENTS[TokenType.IF] = Parser.if_statement
+_STATEMENTS[TokenType.PRINT] = Parser.print_statement
+_STATEMENTS[TokenType.WHILE] = Parser.while_statement
+_STATEMENTS[TokenType.LEFT_BRACE] = Parser.block_statement
 
 def test_parser():
     from scanner import Scanner
@@ -310,6 +426,27 @@ def test_parser():
     assert parse('nil;') == [ExprStmt(Literal(None))]
     assert parse('print "hello";') == [Print(Literal('hello'))]
     assert parse('print 2;') == [Print(Literal(2))] 
+    # Test constant folding
+    assert parse('print (2 + 3) * 4;') == [Print(Literal(20))]
+    assert parse('print -2 < 1;') == [Print(Literal(True))]
+    assert parse('print 1 - 2 - 3 == 2 * 3 - 10;') == [Print(Literal(True))]
+    # Test that blocks without declarations are flattened
+    assert parse('{ print 1; { print 2; } }') == [Print(Literal(1)), Print(Literal(2))]
+    assert len(parse('{ var a = 1; { print a; } }')) == 1
+    # Test that and/or chain to the left, and bind and tighter
+    expr = parse('a or b and c or d;')[0].value
+    assert isinstance(expr.left, Logical) and expr.right.name.lexeme == 'd'
+    assert expr.left.right.op.lexeme == 'and'
+    # Test that folded constants share the parser's literal nodes
+    folded, literal = parse('print 1 + 1; print 2;')
+    assert folded.value is literal.value
+    # Test that -0 doesn't share a cached 0
+    zero, negative_zero = parse('print 0; print -0;')
+    assert negative_zero == Print(Literal(-0.0))
+    assert math.copysign(1.0, negative_zero.value.value) == -1.0
+    assert math.copysign(1.0, zero.value.value) == 1.0
+    # Test that a syntax error skips to the next statement
+    assert parse('print ); print 1;') == [None, Print(Literal(1))]
     test = parse('var a = 0;\n'
               'var temp;\n'
               'for (var b = 1; a < 10000; b = temp + b) {\n'
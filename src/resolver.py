@@ -0,0 +1,112 @@
+# resolver.py
+
+from expr import NodeVisitor
+
+class Resolver(NodeVisitor):
+    '''
+    This class walks a syntax tree before it runs and gives every variable
+    an integer slot, so reading a variable is an index into a list instead
+    of a lookup by name. Each block declaration gets its own slot, so
+    shadowed variables never share one.
+
+    Attributes
+    ----------
+    globals : dict
+        slots of top-level variables, kept between runs for the REPL
+    scopes : list
+        one dict of slots per enclosing block, innermost last, with the
+        globals at the bottom
+    slots : int
+        number of slots handed out so far
+    '''
+    def __init__(self):
+        super().__init__()
+        self.globals = {}
+        self.scopes = [self.globals]
+        self.slots = 0
+
+    def resolve(self, statements):
+        for stmt in statements:
+            self.visit(stmt)
+        return self.slots
+
+    def new_slot(self):
+        self.slots += 1
+        return self.slots - 1
+
+    def declare(self, name):
+        scope = self.scopes[-1]
+        if scope is self.globals:
+            # Redeclaring a global reuses its slot
+            if name not in scope:
+                scope[name] = self.new_slot()
+            return scope[name]
+
+        scope[name] = self.new_slot()
+        return scope[name]
+
+    def lookup(self, name):
+        scopes = self.scopes
+        if len(scopes) > 1:
+            for scope in reversed(scopes):
+                if name in scope:
+                    return scope[name]
+        elif name in self.globals:
+            return self.globals[name]
+
+        # Not declared yet, reads as nil until a global declares it
+        slot = self.globals[name] = self.new_slot()
+        return slot
+
+    def visit_Literal(self, node):
+        pass
+
+    def visit_Grouping(self, node):
+        self.visit(node.value)
+
+    def visit_Logical(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def visit_Unary(self, node):
+        self.visit(node.right)
+
+    def visit_Binary(self, node):
+        self.visit(node.left)
+        self.visit(node.right)
+
+    def visit_Variable(self, node):
+        node.slot = self.lookup(node.name.lexeme)
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        node.slot = self.lookup(node.name.lexeme)
+
+    def visit_ExprStmt(self, node):
+        self.visit(node.value)
+
+    def visit_Print(self, node):
+        self.visit(node.value)
+
+    def visit_VarDeclaration(self, node):
+        if node.initializer:
+            self.visit(node.initializer)
+        node.slot = self.declare(node.name.lexeme)
+
+    def visit_Block(self, node):
+        self.scopes.append({})
+        try:
+            for stmt in node.statements:
+                self.visit(stmt)
+        finally:
+            self.scopes.pop()
+
+    def visit_IfStmt(self, node):
+        self.visit(node.test)
+        self.visit(node.consequence)
+        if node.alternative:
+            self.visit(node.alternative)
+
+    def visit_WhileStmt(self, node):
+        self.visit(node.test)
+        self.visit(node.body)
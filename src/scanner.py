@@ -1,7 +1,95 @@
 # scanner.py
 
-from tokens import Token
+import re
+import sys
+from tokens import TokenStream
 from token_type import TokenType
+from codegen_numba import NUMBA_AVAILABLE
+
+# Sources at least this long are scanned natively. The native scan saves
+# about 0.2 s per million characters over the regex, and importing Numba
+# costs about 0.5 s, so anything shorter is quicker without it.
+NATIVE_MIN_LENGTH = 1 << 22
+
+# Skips any whitespace and comments, then one alternative per kind of
+# lexeme, tried in order. Skipping inside the regex means the scanner loop
+# never sees them. A string missing its closing quote still matches, up to
+# the end of the source, and anything else that isn't Lox falls through to
+# ERROR one character at a time. The skip is greedy and some alternative
+# always matches after it (END at the end of the source), so it's never
+# backtracked into.
+_LEXEME = re.compile(r'''
+    (?:[ \t\r]|//[^\n]*)*
+    (?:
+    (?P<NL>\n)
+  | (?P<IDENTIFIER>[A-Za-z_][A-Za-z_0-9]*)
+  | (?P<NUMBER>[0-9]+(?:\.[0-9]+)?)
+  | (?P<OPERATOR>[!=<>]=?|[(){},.\-+;*/])
+  | (?P<STRING>"[^"]*"?)
+  | (?P<ERROR>.)
+  | (?P<END>\Z)
+    )
+''', re.VERBOSE | re.DOTALL)
+
+_OPERATORS = {
+    '(': TokenType.LEFT_PAREN,
+    ')': TokenType.RIGHT_PAREN,
+    '{': TokenType.LEFT_BRACE,
+    '}': TokenType.RIGHT_BRACE,
+    ',': TokenType.COMMA,
+    '.': TokenType.DOT,
+    '-': TokenType.MINUS,
+    '+': TokenType.PLUS,
+    ';': TokenType.SEMICOLON,
+    '*': TokenType.STAR,
+    '/': TokenType.SLASH,
+    '!': TokenType.BANG,
+    '!=': TokenType.BANG_EQUAL,
+    '=': TokenType.EQUAL,
+    '==': TokenType.EQUAL_EQUAL,
+    '<': TokenType.LESS,
+    '<=': TokenType.LESS_EQUAL,
+    '>': TokenType.GREATER,
+    '>=': TokenType.GREATER_EQUAL,
+}
+
+# Built once for every scanner. String literals are interned, so an
+# interned identifier finds its keyword on identity.
+_KEYWORDS = {
+    'and': TokenType.AND,
+    'class': TokenType.CLASS,
+    'else':  TokenType.ELSE,
+    'false': TokenType.FALSE,
+    'for':   TokenType.FOR,
+    'fun':   TokenType.FUN,
+    'if':    TokenType.IF,
+    'nil':   TokenType.NIL,
+    'or':    TokenType.OR,
+    'print': TokenType.PRINT,
+    'return': TokenType.RETURN,
+    'super': TokenType.SUPER,
+    'this':  TokenType.THIS,
+    'true':  TokenType.TRUE,
+    'var':   TokenType.VAR,
+    'while': TokenType.WHILE,
+}
+
+# Token types the scanning loops use, as module globals rather than an
+# attribute lookup on the enum class for every token
+IDENTIFIER = TokenType.IDENTIFIER
+STRING = TokenType.STRING
+NUMBER = TokenType.NUMBER
+EOF = TokenType.EOF
+
+# Members by value, to turn the native scanner's type codes back into them
+_TYPES = [None] * (max(TokenType) + 1)
+for _type in TokenType:
+    _TYPES[_type] = _type
+
+# The lexeme of each token type that always has the same one, by type
+_LEXEMES = [None] * (max(TokenType) + 1)
+for _text, _type in (_OPERATORS | _KEYWORDS).items():
+    _LEXEMES[_type] = _text
 
 class Scanner:
     '''
@@ -14,187 +102,107 @@ class Scanner:
         raw source code
     error_handler : class
         reports errors
-    tokens : list
+    tokens : TokenStream
         stores individual tokens from raw source code
-    start : int
-        points to the first character in the lexeme being scanned
-    current : int
-        points at the character currently being considered
     line : int 
-        tracks what source line current is on
+        tracks what source line the scanner is on
         
     '''
     def __init__(self, source, error_handler):
         self.source = source 
         self.error_handler = error_handler
-        self.tokens = []
-        self.start = 0
-        self.current = 0
+        self.tokens = TokenStream()
         self.line = 1
 
-        self.keywords = {
-            'and': TokenType.AND,
-            'class': TokenType.CLASS,
-            'else':  TokenType.ELSE,
-            'false': TokenType.FALSE,
-            'for':   TokenType.FOR,
-            'fun':   TokenType.FUN,
-            'if':    TokenType.IF,
-            'nil':   TokenType.NIL,
-            'or':    TokenType.OR,
-            'print': TokenType.PRINT,
-            'return': TokenType.RETURN,
-            'super': TokenType.SUPER,
-            'this':  TokenType.THIS,
-            'true':  TokenType.TRUE,
-            'var':   TokenType.VAR,
-            'while': TokenType.WHILE,
-        }
-
     def scan_tokens(self):
-        while not self.is_at_end():
-            self.start = self.current
-            self.scan_token()
-        self.tokens.append(Token(TokenType.EOF, '', None, self.line))
-        return self.tokens
-    
-    def scan_token(self):
-        char = self.advance()
-        match char:
-            case '(':
-                self.add_token(TokenType.LEFT_PAREN)
-            case ')':
-                self.add_token(TokenType.RIGHT_PAREN)
-            case '{':
-                self.add_token(TokenType.LEFT_BRACE)
-            case '}':
-                self.add_token(TokenType.RIGHT_BRACE)
-            case ',':
-                self.add_token(TokenType.COMMA)
-            case '.':
-                self.add_token(TokenType.DOT)
-            case '-':
-                self.add_token(TokenType.MINUS)
-            case '+':
-                self.add_token(TokenType.PLUS)
-            case ';':
-                self.add_token(TokenType.SEMICOLON)
-            case '*':
-                self.add_token(TokenType.STAR)
-            # Two-char-tokens
-            case '!':
-                self.add_token(TokenType.BANG_EQUAL if self.match('=') else TokenType.BANG)
-            case '=':
-                self.add_token(TokenType.EQUAL_EQUAL if self.match('=') else TokenType.EQUAL)
-            case '<':
-                self.add_token(TokenType.LESS_EQUAL if self.match('=') else TokenType.LESS)
-            case '>':
-                self.add_token(TokenType.GREATER_EQUAL if self.match('=') else TokenType.GREATER)
-            case '/':
-                if self.match('/'):
-                    while self.peek() != '\n' and not self.is_at_end():
-                        self.advance()
-                else: 
-                    self.add_token(TokenType.SLASH)
-            case ' ':
-                return None
-            case '\r':
-                return None
-            case '\t':
-                return None
-            case '\n':
-                self.line += 1
-            case '"':
-                self.string()
-            case _:
-                if self.is_digit(char):
-                    self.number()
-                elif self.is_alpha(char):
-                    self.identifier()
-                else:
-                    self.error_handler.error(self.line, 'Unexpected character.')
- 
-    def identifier(self):
-        while self.is_alpha_numeric(self.peek()):
-            self.advance()
-
-        text = self.source[self.start:self.current]
-        type = self.keywords.get(text)
-        if type is None:
-            type = TokenType.IDENTIFIER
-        self.add_token(type)
-                    
-    def number(self):
-        while self.is_digit(self.peek()):
-            self.advance()
-
-        # Look for fractional part
-        if self.peek() == '.' and self.is_digit(self.peek_next()):
-            self.advance()
-
-            while self.is_digit(self.peek()):
-                self.advance()
-
-        self.add_token(TokenType.NUMBER, float(self.source[self.start:self.current]))
-                
-    def string(self):
-        while self.peek() != '"' and not self.is_at_end():
-            if self.peek() == '\n':
-                self.line += 1
-            self.advance()
-        
-        if self.is_at_end():
-            self.error_handler.error(self.line, 'Unterminated string.')
-            return None
-
-        # Closing ".
-        self.advance()
-
-        # Trim the surrounding quotes
-        value = self.source[self.start + 1: self.current - 1]
-        self.add_token(TokenType.STRING, value)
-
-    def match(self, expected):
-        if self.is_at_end():
-            return False
-        if self.source[self.current] != expected:
-            return False
-        
-        self.current += 1
-        return True
-    
-    # Looksahead, but does not consume the character
-    def peek(self):
-        return self.source[self.current] if not self.is_at_end() else '\0'
-    
-    def peek_next(self):
-        if self.current + 1 >= len(self.source):
-            return '\0'
-        else:
-            return self.source[self.current + 1] 
-        
-    def is_alpha(self, char):
-        return ('a' <= char <= 'z' or 'A' <= char <= 'Z') or char == '_'
-    
-    def is_alpha_numeric(self, char):
-        return self.is_alpha(char) or self.is_digit(char)
-    
-    def is_digit(self, char):
-        return char >= '0' and char <= '9'
-    
-    # Tells us if we have consumed all the characters
-    def is_at_end(self):
-        return self.current >= len(self.source)
-    
-    # Consumes the next character in the source file and returns it
-    def advance(self):
-        current_char = self.source[self.current]
-        self.current += 1
-        return current_char
-
-    def add_token(self, type, literal=None):
-        text = self.source[self.start:self.current]
-        self.tokens.append(Token(type, text, literal, self.line))
+        # Non-ASCII source has to go through the regex, only it reports one
+        # error per character rather than per byte
+        if NUMBA_AVAILABLE and len(self.source) >= NATIVE_MIN_LENGTH and self.source.isascii():
+            return self.scan_native()
+
+        # The regex walks the characters in C, this loop only runs once
+        # per lexeme
+        tokens = self.tokens
+        # Fill the token columns directly rather than through
+        # TokenStream.append, one call per column instead of two
+        add_type = tokens.types.append
+        add_lexeme = tokens.lexemes.append
+        add_literal = tokens.literals.append
+        add_line = tokens.lines.append
+        keywords = _KEYWORDS
+        intern = sys.intern
+        line = self.line
+
+        for match in _LEXEME.finditer(self.source):
+            kind = match.lastgroup
+            text = match[kind]
+            if kind == 'IDENTIFIER':
+                # Every use of a name shares one string, so the resolver's
+                # lookups by name compare pointers instead of characters
+                text = intern(text)
+                add_type(keywords.get(text, IDENTIFIER))
+                add_literal(None)
+            elif kind == 'OPERATOR':
+                add_type(_OPERATORS[text])
+                add_literal(None)
+            elif kind == 'NL':
+                line += 1
+                continue
+            elif kind == 'NUMBER':
+                add_type(NUMBER)
+                add_literal(float(text))
+            elif kind == 'STRING':
+                # Strings can span lines, the token gets the line they end on
+                line += text.count('\n')
+                if len(text) < 2 or text[-1] != '"':
+                    self.error_handler.error_at_line(line, 'Unterminated string.')
+                    continue
+                add_type(STRING)
+                # Trim the surrounding quotes
+                add_literal(text[1:-1])
+            elif kind == 'END':
+                break
+            else:
+                self.error_handler.error_at_line(line, 'Unexpected character.')
+                continue
+
+            add_lexeme(text)
+            add_line(line)
+
+        self.line = line
+        tokens.append(EOF, '', None, line)
+        return tokens
+
+    def scan_native(self):
+        import scanner_numba
+
+        source = self.source
+        types, starts, ends, lines, errors, line = scanner_numba.scan(source, _KEYWORDS)
+
+        for code, error_line in errors:
+            if code == scanner_numba.UNTERMINATED_STRING:
+                self.error_handler.error_at_line(error_line, 'Unterminated string.')
+            else:
+                self.error_handler.error_at_line(error_line, 'Unexpected character.')
+
+        # Turn the arrays into the token columns, a comprehension per column
+        intern = sys.intern
+        identifier, number, string = IDENTIFIER, NUMBER, STRING
+        tokens = self.tokens
+        tokens.types = [_TYPES[type] for type in types]
+        # Operators and keywords share one string each from _LEXEMES, only
+        # the other lexemes are sliced out of the source
+        fixed = _LEXEMES
+        tokens.lexemes = [fixed[code] or (intern(source[start:end]) if code == identifier
+                                          else source[start:end])
+                          for code, start, end in zip(types, starts, ends)]
+        tokens.literals = [float(text) if type is number else text[1:-1] if type is string else None
+                           for type, text in zip(tokens.types, tokens.lexemes)]
+        tokens.lines = lines
+
+        self.line = line
+        tokens.append(EOF, '', None, line)
+        return tokens
 
 def test_scanner():
     from error_handler import ErrorHandler
@@ -202,7 +210,7 @@ def test_scanner():
     def scan(source):
         scanner = Scanner(source, ErrorHandler())
         tokens = scanner.scan_tokens()
-        return [getattr(token.type, 'name') for token in tokens]
+        return [type.name for type in tokens.types]
     
     toktypes = scan("""( ) { } , . - + * = ==
                         // This is a comment
@@ -222,6 +230,18 @@ def test_scanner():
 
     toktypes = scan('abc abc123 _abc_123')
     assert toktypes == ['IDENTIFIER', 'IDENTIFIER', 'IDENTIFIER', 'EOF']
+
+    # Strings and comments are skipped over in one go, lines still count
+    tokens = Scanner('"a\nb" // c\n// d\nx ""', ErrorHandler()).scan_tokens()
+    assert tokens.literals == ['a\nb', None, '', None] and tokens.lines == [2, 4, 4, 4]
+
+    # Short sources skip the native scanner, make sure it agrees anyway
+    if NUMBA_AVAILABLE:
+        source = 'var a = 1.5; // c\nwhile (a <= 10) { print "x\ny" + a; a = a * 2; }'
+        regex = Scanner(source, ErrorHandler()).scan_tokens()
+        native = Scanner(source, ErrorHandler()).scan_native()
+        assert (native.types, native.lexemes, native.literals, native.lines) == \
+               (regex.types, regex.lexemes, regex.literals, regex.lines)
     
     print('Good Tests!')
 
@@ -0,0 +1,176 @@
+# scanner_numba.py
+#
+# Scans ASCII source as native code through Numba. The scanner only imports
+# this for long sources, and only when codegen_numba found Numba installed.
+
+from token_type import TokenType
+from codegen_numba import NUMBA_AVAILABLE
+
+if NUMBA_AVAILABLE:
+    import numba
+    import numpy as np
+
+# Error codes reported back by _scan
+UNEXPECTED_CHARACTER = 0
+UNTERMINATED_STRING = 1
+
+# Token types the loop produces itself, as ints
+IDENTIFIER = int(TokenType.IDENTIFIER)
+STRING = int(TokenType.STRING)
+NUMBER = int(TokenType.NUMBER)
+
+NEWLINE = ord('\n')
+SPACE = ord(' ')
+TAB = ord('\t')
+CARRIAGE_RETURN = ord('\r')
+SLASH = ord('/')
+QUOTE = ord('"')
+DOT = ord('.')
+EQUAL = ord('=')
+
+def _tables(keywords):
+    # Lookup tables indexed by character code: what a character starts,
+    # and for ! = < > what it becomes when followed by '='
+    single = np.full(128, -1, dtype=np.int32)
+    for char, type in (('(', TokenType.LEFT_PAREN), (')', TokenType.RIGHT_PAREN),
+                       ('{', TokenType.LEFT_BRACE), ('}', TokenType.RIGHT_BRACE),
+                       (',', TokenType.COMMA), ('.', TokenType.DOT),
+                       ('-', TokenType.MINUS), ('+', TokenType.PLUS),
+                       (';', TokenType.SEMICOLON), ('*', TokenType.STAR),
+                       ('/', TokenType.SLASH), ('!', TokenType.BANG),
+                       ('=', TokenType.EQUAL), ('<', TokenType.LESS),
+                       ('>', TokenType.GREATER)):
+        single[ord(char)] = type
+
+    with_equal = np.full(128, -1, dtype=np.int32)
+    for char, type in (('!', TokenType.BANG_EQUAL), ('=', TokenType.EQUAL_EQUAL),
+                       ('<', TokenType.LESS_EQUAL), ('>', TokenType.GREATER_EQUAL)):
+        with_equal[ord(char)] = type
+
+    # 1 for characters that can start an identifier, 2 for digits
+    classes = np.zeros(128, dtype=np.int8)
+    for code in range(128):
+        char = chr(code)
+        if 'a' <= char <= 'z' or 'A' <= char <= 'Z' or char == '_':
+            classes[code] = 1
+        elif '0' <= char <= '9':
+            classes[code] = 2
+
+    # The keywords back to back, with where each one starts
+    keyword_chars = np.frombuffer(''.join(keywords).encode('ascii'), dtype=np.uint8)
+    keyword_starts = np.zeros(len(keywords) + 1, dtype=np.int64)
+    for index, keyword in enumerate(keywords):
+        keyword_starts[index + 1] = keyword_starts[index] + len(keyword)
+    keyword_types = np.array(list(keywords.values()), dtype=np.int32)
+
+    return single, with_equal, classes, keyword_chars, keyword_starts, keyword_types
+
+def _scan(buf, single, with_equal, classes, keyword_chars, keyword_starts, keyword_types):
+    # The same rules as the regex in scanner.py, one byte at a time. There
+    # can't be more tokens or errors than bytes.
+    n = buf.shape[0]
+    types = np.empty(n, dtype=np.int32)
+    starts = np.empty(n, dtype=np.int64)
+    ends = np.empty(n, dtype=np.int64)
+    lines = np.empty(n, dtype=np.int64)
+    errors = np.empty(n, dtype=np.int32)
+    error_lines = np.empty(n, dtype=np.int64)
+    count = 0
+    nerrors = 0
+
+    line = 1
+    i = 0
+    while i < n:
+        char = buf[i]
+        start = i
+        i += 1
+
+        if char == SPACE or char == TAB or char == CARRIAGE_RETURN:
+            continue
+        if char == NEWLINE:
+            line += 1
+            continue
+
+        if classes[char] == 1:
+            while i < n and classes[buf[i]] != 0:
+                i += 1
+            type = IDENTIFIER
+            for k in range(keyword_types.shape[0]):
+                kstart = keyword_starts[k]
+                length = keyword_starts[k + 1] - kstart
+                if length != i - start:
+                    continue
+                same = True
+                for j in range(length):
+                    if buf[start + j] != keyword_chars[kstart + j]:
+                        same = False
+                        break
+                if same:
+                    type = keyword_types[k]
+                    break
+        elif classes[char] == 2:
+            while i < n and classes[buf[i]] == 2:
+                i += 1
+            # Look for fractional part
+            if i + 1 < n and buf[i] == DOT and classes[buf[i + 1]] == 2:
+                i += 1
+                while i < n and classes[buf[i]] == 2:
+                    i += 1
+            type = NUMBER
+        elif char == SLASH and i < n and buf[i] == SLASH:
+            while i < n and buf[i] != NEWLINE:
+                i += 1
+            continue
+        elif char == QUOTE:
+            # Strings can span lines, the token gets the line they end on
+            while i < n and buf[i] != QUOTE:
+                if buf[i] == NEWLINE:
+                    line += 1
+                i += 1
+            if i == n:
+                errors[nerrors] = UNTERMINATED_STRING
+                error_lines[nerrors] = line
+                nerrors += 1
+                continue
+            i += 1
+            type = STRING
+        elif single[char] >= 0:
+            type = single[char]
+            if with_equal[char] >= 0 and i < n and buf[i] == EQUAL:
+                type = with_equal[char]
+                i += 1
+        else:
+            errors[nerrors] = UNEXPECTED_CHARACTER
+            error_lines[nerrors] = line
+            nerrors += 1
+            continue
+
+        types[count] = type
+        starts[count] = start
+        ends[count] = i
+        lines[count] = line
+        count += 1
+
+    return (types[:count], starts[:count], ends[:count], lines[:count],
+            errors[:nerrors], error_lines[:nerrors], line)
+
+if NUMBA_AVAILABLE:
+    _scan = numba.njit(cache=True)(_scan)
+
+# Built from the scanner's keywords on the first scan
+_TABLES = None
+
+def scan(source, keywords):
+    '''
+    Scan ASCII source natively, with the given keyword table. Returns the
+    token types, where each lexeme starts and ends, the line of each token,
+    the errors found as (code, line) pairs and the line the source ends on.
+    '''
+    global _TABLES
+    if _TABLES is None:
+        _TABLES = _tables(keywords)
+
+    buf = np.frombuffer(source.encode('ascii'), dtype=np.uint8)
+    types, starts, ends, lines, errors, error_lines, line = _scan(buf, *_TABLES)
+    errors = list(zip(errors.tolist(), error_lines.tolist()))
+    return types.tolist(), starts.tolist(), ends.tolist(), lines.tolist(), errors, line
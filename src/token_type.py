@@ -1,11 +1,15 @@
 # token_type.py
 
-from enum import Enum, auto
+from enum import Enum, IntEnum, auto
 
-class TokenType(Enum):
+class TokenType(IntEnum):
     '''
-    Categorize lexemes into their reserved keywords 
+    Categorize lexemes into their reserved keywords. Members are ints so
+    the parser's comparisons between them stay at C level.
     '''
+    # Still print as TokenType.NAME rather than the bare number
+    __str__ = Enum.__str__
+
     # Single character tokens
     LEFT_PAREN = auto()
     RIGHT_PAREN = auto() 
@@ -0,0 +1,215 @@
+# vm.py
+
+from compiler import OpCode
+from error_handler import LoxRuntimeError
+
+class VMState:
+    '''
+    This class holds everything an opcode handler works on while the VM
+    runs a piece of code.
+
+    Attributes
+    ----------
+    code : bytearray
+        one opcode per instruction
+    operands : array
+        operand of each instruction
+    consts : list
+        values referenced by the operands
+    stack : list
+        operand stack
+    locals_ : list
+        variable slots, shared with the interpreter
+    interpreter : class
+        owns the truthiness/printing rules
+    '''
+    __slots__ = ['code', 'operands', 'consts', 'stack', 'locals_', 'interpreter']
+    def __init__(self, code, operands, consts, interpreter):
+        self.code = code
+        self.operands = operands
+        self.consts = consts
+        self.stack = []
+        self.locals_ = interpreter.locals
+        self.interpreter = interpreter
+
+# Opcode handlers. Each one gets the state and the address of its
+# instruction and returns the address of the next instruction to run.
+def _load_const(state, ip):
+    state.stack.append(state.consts[state.operands[ip]])
+    return ip + 1
+
+def _load_slot(state, ip):
+    state.stack.append(state.locals_[state.operands[ip]])
+    return ip + 1
+
+def _store_slot(state, ip):
+    state.locals_[state.operands[ip]] = state.stack[-1]
+    return ip + 1
+
+def _define_slot(state, ip):
+    state.locals_[state.operands[ip]] = state.stack.pop()
+    return ip + 1
+
+def _add(state, ip):
+    s = state.stack
+    left, right = s[-2], s[-1]
+    if not (type(left) is float is type(right) or type(left) is str is type(right)):
+        raise LoxRuntimeError(state.consts[state.operands[ip]], 'operands must be numbers')
+    s[-2] = left + right
+    del s[-1]
+    return ip + 1
+
+def _sub(state, ip):
+    s = state.stack
+    left, right = s[-2], s[-1]
+    if not (type(left) is float is type(right)):
+        raise LoxRuntimeError(state.consts[state.operands[ip]], 'operands must be numbers')
+    s[-2] = left - right
+    del s[-1]
+    return ip + 1
+
+def _mul(state, ip):
+    s = state.stack
+    left, right = s[-2], s[-1]
+    if not (type(left) is float is type(right)):
+        raise LoxRuntimeError(state.consts[state.operands[ip]], 'operands must be numbers')
+    s[-2] = left * right
+    del s[-1]
+    return ip + 1
+
+def _div(state, ip):
+    s = state.stack
+    left, right = s[-2], s[-1]
+    if not (type(left) is float is type(right)):
+        raise LoxRuntimeError(state.consts[state.operands[ip]], 'operands must be numbers')
+    try:
+        s[-2] = left / right
+    except ZeroDivisionError as error:
+        print('ZeroDivisionError:', error)
+        s[-2] = None
+    del s[-1]
+    return ip + 1
+
+def _neg(state, ip):
+    s = state.stack
+    if type(s[-1]) is not float:
+        raise LoxRuntimeError(state.consts[state.operands[ip]], 'operand must be a number')
+    s[-1] = -s[-1]
+    return ip + 1
+
+def _not(state, ip):
+    s = state.stack
+    # Inlined is_truthy
+    s[-1] = s[-1] is None or s[-1] is False
+    return ip + 1
+
+def _eq(state, ip):
+    s = state.stack
+    left, right = s[-2], s[-1]
+    # Inlined is_equal
+    s[-2] = type(left) is type(right) and left == right
+    del s[-1]
+    return ip + 1
+
+def _lt(state, ip):
+    s = state.stack
+    left, right = s[-2], s[-1]
+    if not (type(left) is float is type(right)):
+        raise LoxRuntimeError(state.consts[state.operands[ip]], 'operands must be numbers')
+    s[-2] = left < right
+    del s[-1]
+    return ip + 1
+
+def _le(state, ip):
+    s = state.stack
+    left, right = s[-2], s[-1]
+    if not (type(left) is float is type(right)):
+        raise LoxRuntimeError(state.consts[state.operands[ip]], 'operands must be numbers')
+    s[-2] = left <= right
+    del s[-1]
+    return ip + 1
+
+def _gt(state, ip):
+    s = state.stack
+    left, right = s[-2], s[-1]
+    if not (type(left) is float is type(right)):
+        raise LoxRuntimeError(state.consts[state.operands[ip]], 'operands must be numbers')
+    s[-2] = left > right
+    del s[-1]
+    return ip + 1
+
+def _ge(state, ip):
+    s = state.stack
+    left, right = s[-2], s[-1]
+    if not (type(left) is float is type(right)):
+        raise LoxRuntimeError(state.consts[state.operands[ip]], 'operands must be numbers')
+    s[-2] = left >= right
+    del s[-1]
+    return ip + 1
+
+def _print(state, ip):
+    print(state.interpreter.stringify(state.stack.pop()))
+    return ip + 1
+
+def _pop(state, ip):
+    del state.stack[-1]
+    return ip + 1
+
+def _dup(state, ip):
+    state.stack.append(state.stack[-1])
+    return ip + 1
+
+def _jump(state, ip):
+    return state.operands[ip]
+
+def _jump_if_false(state, ip):
+    value = state.stack.pop()
+    if value is None or value is False:
+        return state.operands[ip]
+    return ip + 1
+
+# Handlers indexed by opcode, so dispatch is one list index and one call
+# instead of walking an if/elif chain
+_HANDLERS = [None] * (max(OpCode) + 1)
+_HANDLERS[OpCode.LOAD_CONST] = _load_const
+_HANDLERS[OpCode.LOAD_SLOT] = _load_slot
+_HANDLERS[OpCode.STORE_SLOT] = _store_slot
+_HANDLERS[OpCode.DEFINE_SLOT] = _define_slot
+_HANDLERS[OpCode.ADD] = _add
+_HANDLERS[OpCode.SUB] = _sub
+_HANDLERS[OpCode.MUL] = _mul
+_HANDLERS[OpCode.DIV] = _div
+_HANDLERS[OpCode.NEG] = _neg
+_HANDLERS[OpCode.NOT] = _not
+_HANDLERS[OpCode.EQ] = _eq
+_HANDLERS[OpCode.LT] = _lt
+_HANDLERS[OpCode.LE] = _le
+_HANDLERS[OpCode.GT] = _gt
+_HANDLERS[OpCode.GE] = _ge
+_HANDLERS[OpCode.PRINT] = _print
+_HANDLERS[OpCode.POP] = _pop
+_HANDLERS[OpCode.JUMP] = _jump
+_HANDLERS[OpCode.JUMP_IF_FALSE] = _jump_if_false
+_HANDLERS[OpCode.DUP] = _dup
+
+class VM:
+    '''
+    This class runs the bytecode produced by the compiler on an operand
+    stack, sharing variables and value semantics with the interpreter.
+
+    Attributes
+    ----------
+    interpreter : class
+        owns the variable slots and the truthiness/printing rules
+    '''
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+
+    def run(self, code, operands, consts):
+        state = VMState(code, operands, consts, self.interpreter)
+        handlers = _HANDLERS
+
+        ip = 0
+        n = len(code)
+        while ip < n:
+            ip = handlers[code[ip]](state, ip)